@@ -4,6 +4,8 @@ Test script for Cloud Function authentication integration.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import hashlib
 import base64
@@ -21,6 +23,12 @@ BASE_URL = LOCAL_URL  # Default to local
 CLOUD_FUNCTION_URL = os.getenv('CLOUD_FUNCTION_URL')
 CLOUD_FUNCTION_URL="https://us-central1-iucc-f4d.cloudfunctions.net/login_and_issue_jwt"
 
+# Shared keep-alive session: reuses TCP/TLS connections across calls and retries transient connect failures
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 def hash_password(password: str) -> str:
     """Hash password using SHA256 + BASE64."""
     # Remove spaces from password
@@ -81,7 +89,7 @@ def test_cloud_function_direct():
         print(f"🌐 Calling Cloud Function: {CLOUD_FUNCTION_URL}")
         
         # Call Cloud Function
-        response = requests.post(
+        response = SESSION.post(
             CLOUD_FUNCTION_URL,
             json=payload,
             headers={"Content-Type": "application/json"},
@@ -133,7 +141,7 @@ def test_fastapi_login():
         print(f"🌐 Calling FastAPI login: {BASE_URL}/auth/login")
         
         # Call FastAPI login endpoint
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/auth/login",
             json=payload,
             headers={"Content-Type": "application/json"},
@@ -184,7 +192,7 @@ def test_authenticated_endpoint(token):
     
     try:
         # Call authenticated endpoint
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/analyze/tukey",
             json=test_data,
             headers={
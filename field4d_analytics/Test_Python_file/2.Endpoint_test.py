@@ -4,11 +4,19 @@ Simple endpoint test - just check if endpoints are responding.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 
 # BASE_URL = "http://localhost:8000" 
 BASE_URL = "http://localhost:8080"
 
+# Shared keep-alive session: reuses TCP/TLS connections across calls and retries transient connect failures
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 def get_auth_token():
     """Get authentication token either manually or via login."""
     print("\n🔑 Authentication Options:")
@@ -41,7 +49,7 @@ def get_auth_token():
                 "password": password
             }
             
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/auth/login",
                 json=login_data,
                 headers={"Content-Type": "application/json"}
@@ -76,7 +84,7 @@ def test_endpoint(endpoint, payload, expected_status=200, auth_token=None):
         if auth_token:
             headers["Authorization"] = f"Bearer {auth_token}"
         
-        response = requests.post(f"{BASE_URL}{endpoint}", json=payload, headers=headers, timeout=10)
+        response = SESSION.post(f"{BASE_URL}{endpoint}", json=payload, headers=headers, timeout=10)
         print(f"{endpoint}: {response.status_code}")
         
         if response.status_code != expected_status:
@@ -123,7 +131,7 @@ def main():
     # Test health endpoints (no auth required)
     print("Testing health endpoints...")
     try:
-        response = requests.get(f"{BASE_URL}/health", timeout=5)
+        response = SESSION.get(f"{BASE_URL}/health", timeout=5)
         print(f"/health: {response.status_code}")
 
     except Exception as e:
@@ -3,16 +3,33 @@
 Simple Test Matrix for Field4D StatDeck API
 All tests use 3-minute intervals for consistency.
 Saves results in organized structure similar to batching tests.
+
+Set LOG_RAW=1 to also save each test's full dataset and API response
+(<test_id>_test_data.json / <test_id>_response.json); per-test result
+summaries and the run-level CSV/JSON files are always written.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import gzip
 import time
 from datetime import datetime, timedelta
-import random
-import pandas as pd
+import numpy as np
+import csv
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to ujson, then the stdlib encoder
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 # Define port as a variable
 API_PORT = 8080  # Change this to 8000 or 8080 as needed
@@ -21,6 +38,58 @@ API_PORT = 8000  # Change this to 8000 or 8080 as needed
 # API URLs using the port variable
 API_URL = f"http://localhost:{API_PORT}/analyze/tukey"
 OUTPUT_DIR = "API_test_output/Test_Matrix"
+# Tests to run at once. 1 keeps per-test timings uncontended; higher values overlap
+# the network waits (wall-clock ~ slowest test) but tests then compete for the server.
+MAX_PARALLEL_TESTS = 1
+DATA_SEED = 42  # Fixed seed so generated datasets are reproducible across runs
+LOG_RAW = os.environ.get("LOG_RAW") == "1"  # Save raw per-test datasets and responses (large)
+COMPRESS_REQUESTS = False  # gzip request bodies (server must use app.compression.GzipRoute)
+GZIP_MIN_BYTES = 64 * 1024  # with COMPRESS_REQUESTS, only bodies above this size are gzipped
+
+# Background writer for large dataset files, so disk I/O overlaps the API request
+IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="io")
+
+# Shared keep-alive session: tests reuse one connection instead of reconnecting per request.
+# Connect failures and transient gateway errors are retried; the final response still goes through
+# normal status handling. Read timeouts are never retried, so a slow analysis surfaces as Timeout
+# once instead of silently re-sending the POST (and inflating the measured time).
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(max_retries=Retry(
+    connect=3,
+    read=False,  # re-raise read timeouts as-is (read=0 would surface them as ConnectionError)
+    status=3,
+    backoff_factor=0.2,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=None,  # the analysis POST is idempotent
+    raise_on_status=False
+)))
+SESSION.headers.update({"Content-Type": "application/json"})  # every request body is JSON
+
+def dumps_json(obj, indent=False):
+    """Serialize an object to UTF-8 JSON bytes, preferring orjson, then ujson."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    if ujson is not None:
+        return ujson.dumps(obj, indent=2 if indent else 0, ensure_ascii=False, default=str).encode('utf-8')
+    return json.dumps(obj, indent=2 if indent else None, default=str).encode('utf-8')
+
+def loads_json(data):
+    """Parse UTF-8 JSON bytes, preferring orjson, then ujson."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if ujson is not None:
+        return ujson.loads(data)
+    return json.loads(data)
+
+def write_bytes_file(path, content):
+    """Write pre-serialized bytes to a file."""
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def splice_json_field(obj, field, value_bytes):
+    """Append an already-serialized JSON value to a serialized object as its last field."""
+    return dumps_json(obj)[:-1] + b',' + dumps_json(field) + b':' + value_bytes + b'}'
 
 def get_auth_token():
     """Get authentication token either manually or via login."""
@@ -55,14 +124,13 @@ def get_auth_token():
                 "password": password
             }
             
-            response = requests.post(
+            response = SESSION.post(
                 f"http://localhost:{API_PORT}/auth/login",
-                json=login_data,
-                headers={"Content-Type": "application/json"}
+                json=login_data
             )
             
             if response.status_code == 200:
-                data = response.json()
+                data = loads_json(response.content)
                 if data.get("success"):
                     print("✅ Login successful!")
                     return data.get("token")
@@ -107,7 +175,7 @@ TEST_MATRIX = [
     ("T8", "Validation", ["Control", "Treatment"], 2, 1, 1920, 10000, "Basic validation test - small dataset"),
 ]
 
-def generate_test_data(groups, replicates, days, start_date="2025-06-01"):
+def generate_test_data(groups, replicates, days, start_date="2025-06-01", seed=None):
     """
     Generate synthetic test data with 3-minute intervals.
     
@@ -116,36 +184,34 @@ def generate_test_data(groups, replicates, days, start_date="2025-06-01"):
         replicates (int): Number of replicates per group per timestamp
         days (int): Number of days to generate
         start_date (str): Start date in YYYY-MM-DD format
+        seed (int, optional): Seed for reproducible noise
     
     Returns:
         list: List of data dictionaries for API input
     """
-    data = []
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    
-    # Generate data for each day
-    for day in range(days):
-        current_date = start_dt + timedelta(days=day)
-        
-        # Generate data for each 3-minute interval (480 intervals per day)
-        for interval in range(0, 24 * 60, 3):
-            timestamp = (current_date + timedelta(minutes=interval)).strftime("%Y-%m-%d %H:%M")
-            
-            # Generate data for each group
-            for group in groups:
-                # Generate replicates for this group at this timestamp
-                for rep in range(replicates):
-                    # Create realistic data with group effects
-                    base_value = 20.0  # Base value
-                    group_effect = groups.index(group) * 2.5  # Group effect
-                    noise = random.gauss(0, 1.5)  # Random noise
-                    value = base_value + group_effect + noise
-                    
-                    data.append({
-                        "timestamp": timestamp,
-                        "label": group,
-                        "value": round(value, 2)
-                    })
+    # 3-minute timestamps (480 per day), formatted once each
+    minutes = np.datetime64(start_date, 'm') + np.arange(days * 480) * np.timedelta64(3, 'm')
+    timestamps = np.char.replace(np.datetime_as_string(minutes, unit='m'), 'T', ' ').tolist()
+    
+    # Row layout per timestamp: each group repeated `replicates` times
+    row_labels = [group for group in groups for _ in range(replicates)]
+    row_effects = np.repeat(np.arange(len(groups)) * 2.5, replicates)  # Group effect
+    rows_per_timestamp = len(row_labels)
+    
+    # Base value + group effect + random noise, all drawn and rounded in C
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0, 1.5, len(timestamps) * rows_per_timestamp)
+    values = np.round(20.0 + np.tile(row_effects, len(timestamps)) + noise, 2).tolist()
+    
+    # Materialize the API records once at the end
+    data = [
+        {"timestamp": timestamp, "label": label, "value": value}
+        for timestamp, label, value in zip(
+            (timestamp for timestamp in timestamps for _ in range(rows_per_timestamp)),
+            row_labels * len(timestamps),
+            values
+        )
+    ]
     
     return data
 
@@ -182,12 +248,12 @@ def run_single_test(test_id, name, groups, replicates, days, expected_points, re
     
     # Generate test data
     print("Generating test data...")
-    data = generate_test_data(groups, replicates, days)
+    data = generate_test_data(groups, replicates, days, seed=DATA_SEED)
     actual_points = len(data)
     print(f"Generated {actual_points:,} data points")
     
-    # Save test data
-    test_data_file = os.path.join(test_dir, f"{test_id}_test_data.json")
+    # Save test data (only with LOG_RAW; the dataset dominates disk I/O)
+    test_data_file = os.path.join(test_dir, f"{test_id}_test_data.json") if LOG_RAW else None
     test_data = {
         "test_id": test_id,
         "test_name": name,
@@ -197,38 +263,44 @@ def run_single_test(test_id, name, groups, replicates, days, expected_points, re
         "expected_points": expected_points,
         "actual_points": actual_points,
         "recommended_batch_size": recommended_batch_size,
-        "description": description,
-        "data": data
+        "description": description
     }
-    with open(test_data_file, 'w') as f:
-        json.dump(test_data, f, indent=2)
-    print(f"Test data saved to: {test_data_file}")
+    # Encode the dataset once and splice the same bytes into the saved file and the request body
+    data_bytes = dumps_json(data)
+    # Written on the IO pool while the request is in flight
+    test_data_write = None
+    if LOG_RAW:
+        test_data_write = IO_POOL.submit(write_bytes_file, test_data_file, splice_json_field(test_data, "data", data_bytes))
     
     # Prepare API request
-    payload = {
-        "parameter": "temperature",
-        "data": data
-    }
+    body = splice_json_field({"parameter": "temperature"}, "data", data_bytes)
+    headers = {}
+    
+    # Add authentication header if token provided
+    if auth_token:
+        headers["Authorization"] = f"Bearer {auth_token}"
+    
+    # Optionally compress large bodies (level 1: fast, still ~5x smaller for this schema);
+    # done before the timer starts so client-side compression is not counted as API time
+    if COMPRESS_REQUESTS and len(body) > GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
     
     # Run API request
     print("Sending API request...")
-    start_time = time.time()
-    start_datetime = datetime.now().isoformat()
+    # One wall-clock read per request; the end time is derived from the monotonic elapsed time
+    start_time = time.perf_counter()
+    start_dt = datetime.now()
+    start_datetime = start_dt.isoformat()
     
     try:
-        headers = {"Content-Type": "application/json"}
-        
-        # Add authentication header if token provided
-        if auth_token:
-            headers["Authorization"] = f"Bearer {auth_token}"
-        
-        response = requests.post(API_URL, json=payload, headers=headers, timeout=300)  # 5 min timeout
-        elapsed_time = time.time() - start_time
-        end_datetime = datetime.now().isoformat()
+        response = SESSION.post(API_URL, data=body, headers=headers, timeout=300)  # 5 min timeout
+        elapsed_time = time.perf_counter() - start_time
+        end_datetime = (start_dt + timedelta(seconds=elapsed_time)).isoformat()
         
         # Process response
         if response.status_code == 200:
-            result = response.json()
+            result = loads_json(response.content)
             success = True
             error_message = None
             results_count = len(result.get('results', []))
@@ -254,18 +326,23 @@ def run_single_test(test_id, name, groups, replicates, days, expected_points, re
         success = False
         error_message = "Request timeout"
         results_count = 0
-        elapsed_time = time.time() - start_time
-        end_datetime = datetime.now().isoformat()
+        elapsed_time = time.perf_counter() - start_time
+        end_datetime = (start_dt + timedelta(seconds=elapsed_time)).isoformat()
         print(f"⏰ TIMEOUT: {elapsed_time:.3f}s")
         
     except Exception as e:
         success = False
         error_message = str(e)
         results_count = 0
-        elapsed_time = time.time() - start_time
-        end_datetime = datetime.now().isoformat()
+        elapsed_time = time.perf_counter() - start_time
+        end_datetime = (start_dt + timedelta(seconds=elapsed_time)).isoformat()
         print(f"💥 ERROR: {error_message}")
     
+    # Make sure the dataset file is on disk before reporting it
+    if test_data_write is not None:
+        test_data_write.result()
+        print(f"Test data saved to: {test_data_file}")
+    
     # Calculate throughput
     throughput = actual_points / elapsed_time if elapsed_time > 0 else 0
     
@@ -292,17 +369,18 @@ def run_single_test(test_id, name, groups, replicates, days, expected_points, re
     }
     
     # Save API response if successful
-    if success:
+    if success and LOG_RAW:
         response_file = os.path.join(test_dir, f"{test_id}_response.json")
-        with open(response_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        with open(response_file, 'wb') as f:
+            f.write(dumps_json(result, indent=True))
         test_result["response_file"] = response_file
         print(f"Response saved to: {response_file}")
     
     # Save test result
     result_file = os.path.join(test_dir, f"{test_id}_result.json")
-    with open(result_file, 'w') as f:
-        json.dump(test_result, f, indent=2, default=str)
+    test_result["result_file"] = result_file
+    with open(result_file, 'wb') as f:
+        f.write(dumps_json(test_result, indent=True))
     print(f"Test result saved to: {result_file}")
     # Print test runtime
     test_total_time = time.time() - test_start_time
@@ -331,8 +409,7 @@ def run_test_matrix():
     test_run_id = f"test_matrix_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
     print(f"Test Run ID: {test_run_id}")
     
-    # Create output directory structure
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    # Create output directory structure (makedirs also creates OUTPUT_DIR)
     logs_dir = os.path.join(OUTPUT_DIR, "logs", test_run_id)
     os.makedirs(logs_dir, exist_ok=True)
     
@@ -346,11 +423,19 @@ def run_test_matrix():
     print(f"📊 Total tests to run: {len(TEST_MATRIX)}")
     print(f"{'='*60}")
     
-    for i, test_config in enumerate(TEST_MATRIX, 1):
+    def run_config(indexed_config):
+        i, test_config = indexed_config
         test_id, name, groups, replicates, days, expected_points, recommended_batch_size, description = test_config
         print(f"\n📋 Test {i}/{len(TEST_MATRIX)}")
-        result = run_single_test(test_id, name, groups, replicates, days, expected_points, recommended_batch_size, description, test_run_id, auth_token)
-        results.append(result)
+        return run_single_test(test_id, name, groups, replicates, days, expected_points, recommended_batch_size, description, test_run_id, auth_token)
+    
+    if MAX_PARALLEL_TESTS > 1:
+        # Tests share the pooled SESSION; map() keeps results in matrix order
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_TESTS) as executor:
+            results = list(executor.map(run_config, enumerate(TEST_MATRIX, 1)))
+    else:
+        for indexed_config in enumerate(TEST_MATRIX, 1):
+            results.append(run_config(indexed_config))
     
     total_time = time.time() - start_time
     test_end_datetime = datetime.now().isoformat()
@@ -385,14 +470,17 @@ def run_test_matrix():
     print(f"\n{'='*120}")
     print("📋 DETAILED RESULTS")
     print(f"{'='*120}")
-    print(f"{'Test':<8} {'Name':<15} {'Groups':<8} {'Reps':<4} {'Days':<4} {'Points':<8} {'Batch':<8} {'Time(s)':<8} {'Status':<8} {'Throughput':<12}")
-    print("-" * 130)
-    
+    # Build the whole table first and emit it with a single write
+    table = [
+        f"{'Test':<8} {'Name':<15} {'Groups':<8} {'Reps':<4} {'Days':<4} {'Points':<8} {'Batch':<8} {'Time(s)':<8} {'Status':<8} {'Throughput':<12}",
+        "-" * 130
+    ]
     for result in results:
         status = "✅ PASS" if result['success'] else "❌ FAIL"
         throughput_str = f"{result['throughput']:.0f}/s" if result['success'] else "N/A"
         batch_size = result.get('recommended_batch_size', 'N/A')
-        print(f"{result['test_id']:<8} {result['test_name']:<15} {len(result['groups']):<8} {result['replicates']:<4} {result['days']:<4} {result['actual_points']:<8} {batch_size:<8} {result['elapsed_time']:<8.3f} {status:<8} {throughput_str:<12}")
+        table.append(f"{result['test_id']:<8} {result['test_name']:<15} {len(result['groups']):<8} {result['replicates']:<4} {result['days']:<4} {result['actual_points']:<8} {batch_size:<8} {result['elapsed_time']:<8.3f} {status:<8} {throughput_str:<12}")
+    print("\n".join(table))
     
     # Failed tests details
     if failed_tests:
@@ -410,15 +498,6 @@ def run_test_matrix():
         print(f"  Throughput: {best_test['throughput']:.0f} points/second")
         print(f"  Configuration: {len(best_test['groups'])} groups, {best_test['replicates']} reps, {best_test['days']} days")
     
-    # Create DataFrame for CSV export
-    df = pd.DataFrame(results)
-    
-    # Add derived columns
-    df['Total_Time_Minutes'] = df['elapsed_time'] / 60
-    df['Data_Points_Per_Test'] = df['actual_points']
-    df['Test_Category'] = df['actual_points'].apply(lambda x: 
-        'Small' if x < 1000 else 'Medium' if x < 3000 else 'Large')
-    
     # Add batch size recommendations based on dataset size
     def get_batch_recommendation(points):
         if points < 50000:
@@ -430,29 +509,42 @@ def run_test_matrix():
         else:
             return "3,000 (Very large dataset)"
     
-    df['Batch_Size_Recommendation'] = df['actual_points'].apply(get_batch_recommendation)
+    # Add derived columns (on copies, so the JSON results below stay unchanged)
+    csv_rows = [
+        {
+            **r,
+            'Total_Time_Minutes': r['elapsed_time'] / 60,
+            'Data_Points_Per_Test': r['actual_points'],
+            'Test_Category': 'Small' if r['actual_points'] < 1000 else 'Medium' if r['actual_points'] < 3000 else 'Large',
+            'Batch_Size_Recommendation': get_batch_recommendation(r['actual_points'])
+        }
+        for r in results
+    ]
     
-    # Reorder columns for CSV
+    # Column order for CSV
     columns_order = [
         'test_id', 'test_name', 'Test_Category', 'groups', 'replicates', 'days',
         'expected_points', 'actual_points', 'Data_Points_Per_Test', 'recommended_batch_size', 'Batch_Size_Recommendation',
         'success', 'elapsed_time', 'Total_Time_Minutes', 'throughput', 'results_count',
         'description', 'test_data_file', 'response_file', 'timestamp'
     ]
-    df = df[columns_order]
     
     # Save results
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # Save as CSV
     csv_file = os.path.join(OUTPUT_DIR, f"test_matrix_results_{timestamp}.csv")
-    df.to_csv(csv_file, index=False)
+    with open(csv_file, 'w', newline='') as f:
+        # restval: response_file only exists for successful tests
+        writer = csv.DictWriter(f, fieldnames=columns_order, restval='', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(csv_rows)
     print(f"\n📊 CSV results saved to: {csv_file}")
     
     # Save as JSON
     json_file = os.path.join(OUTPUT_DIR, f"test_matrix_results_{timestamp}.json")
-    with open(json_file, 'w') as f:
-        json.dump({
+    with open(json_file, 'wb') as f:
+        f.write(dumps_json({
             "test_run": {
                 "test_run_id": test_run_id,
                 "start_time": test_start_datetime,
@@ -464,7 +556,7 @@ def run_test_matrix():
                 "success_rate": (len(successful_tests) / len(results)) * 100 if results else 0
             },
             "results": results
-        }, f, indent=2, default=str)
+        }, indent=True))
     print(f"📋 JSON results saved to: {json_file}")
     
     # Create test run summary
@@ -484,8 +576,8 @@ def run_test_matrix():
     }
     
     run_summary_file = os.path.join(OUTPUT_DIR, f"test_run_summary_{test_run_id}.json")
-    with open(run_summary_file, 'w') as f:
-        json.dump(run_summary, f, indent=2, default=str)
+    with open(run_summary_file, 'wb') as f:
+        f.write(dumps_json(run_summary, indent=True))
     print(f"📋 Test run summary saved to: {run_summary_file}")
     
     # Print file structure summary
@@ -498,12 +590,12 @@ def run_test_matrix():
     
     for result in results:
         test_id = result['test_id']
-        test_dir = os.path.join(logs_dir, test_id)
         print(f"🧪 {test_id}:")
-        print(f"   📄 Test data: {result['test_data_file']}")
+        if result['test_data_file']:
+            print(f"   📄 Test data: {result['test_data_file']}")
         if 'response_file' in result:
             print(f"   📊 Response: {result['response_file']}")
-        print(f"   📋 Result: {os.path.join(test_dir, f'{test_id}_result.json')}")
+        print(f"   📋 Result: {result['result_file']}")
     
     return results
 
@@ -514,10 +606,10 @@ def main():
     try:
         # Test API connectivity first
         print("🔍 Testing API connectivity...")
-        health_response = requests.get(f"http://localhost:{API_PORT}/health", timeout=5)
+        health_response = SESSION.get(f"http://localhost:{API_PORT}/health", timeout=5)
         if health_response.status_code == 200:
             print("✅ API is running and accessible")
-            health_data = health_response.json()
+            health_data = loads_json(health_response.content)
             print(f"   Version: {health_data.get('version', 'Unknown')}")
             print(f"   Batch validation: {health_data.get('batch_validation', {}).get('max_batch_size', 'Unknown')} max points")
         else:
@@ -536,4 +628,7 @@ def main():
     print(f"⏱️  Total execution time: {sum(r['elapsed_time'] for r in results):.2f}s")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    try:
+        main()
+    finally:
+        SESSION.close() 
\ No newline at end of file
@@ -5,6 +5,8 @@ Divides data into configurable batches and processes them sequentially.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
 import time
@@ -13,6 +15,13 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Generator
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
 
 # Configuration
 PORT = 8080  # Can be 8000 or 8080
@@ -33,6 +42,19 @@ TIMESTAMP = datetime.now().strftime("%Y%m%d_%H%M%S")
 OUTPUT_DIR = SCRIPT_DIR /"API_test_output" /"batch_processing_output" / f"{TEST_DATA_PATH.stem}_batch_{BATCH_SIZE}"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """Serialize an object to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+def loads_json(data: bytes) -> Any:
+    """Parse UTF-8 JSON bytes (e.g. response.content), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 class BatchProcessor:
     """Process large datasets by dividing them into manageable batches."""
     
@@ -43,6 +65,40 @@ class BatchProcessor:
         self.results = {}
         self.batch_results = []
         self.total_processing_time = 0
+        self._timestamp_indices = None  # timestamp -> row positions in data, built once per load
+        
+        # One keep-alive Session per thread (login, health check and each batch worker),
+        # so requests reuse a pooled connection without sharing a Session across threads
+        self._thread_local = threading.local()
+        self._print_lock = threading.Lock()
+        
+    def get_session(self) -> requests.Session:
+        """
+        Return the calling thread's Session, creating it on first use.
+        
+        Connect failures and transient 502/503/504s are retried; read timeouts are not
+        (read=False re-raises them as Timeout), since process_batch has its own retry and
+        must not re-send a slow batch behind its back.
+        """
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=1,
+                max_retries=Retry(connect=3, read=False, status=3, backoff_factor=0.5,
+                                  status_forcelist=[502, 503, 504], allowed_methods=None,
+                                  raise_on_status=False)
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._thread_local.session = session
+        return session
+    
+    def _print(self, *lines: str):
+        """Print lines as one block, so output from concurrent batches does not interleave."""
+        with self._print_lock:
+            print("\n".join(lines))
         
     def load_test_data(self, data_path: Optional[Path] = None) -> bool:
         """Load and validate test data from JSON file."""
@@ -50,8 +106,9 @@ class BatchProcessor:
             data_path = TEST_DATA_PATH
             
         try:
-            with open(data_path, 'r') as f:
-                self.test_data = json.load(f)
+            with open(data_path, 'rb') as f:
+                self.test_data = loads_json(f.read())
+            self._timestamp_indices = None
             
             print(f"✅ Test data loaded successfully")
             print(f"   Parameter: {self.test_data.get('parameter')}")
@@ -78,45 +135,42 @@ class BatchProcessor:
             print(f"❌ Error loading test data: {str(e)}")
             return False
     
+    def _get_timestamp_indices(self, df: Optional[pd.DataFrame] = None) -> Dict[Any, Any]:
+        """Map each timestamp to the row positions of its records (one hashed groupby pass, cached)."""
+        if self._timestamp_indices is None:
+            if df is None:
+                df = pd.DataFrame(self.test_data.get('data', []), columns=['timestamp'])
+            self._timestamp_indices = df.groupby('timestamp', sort=True).indices
+        return self._timestamp_indices
+    
     def _analyze_data_structure(self):
         """Analyze the structure of the test data."""
         data = self.test_data.get('data', [])
+        df = pd.DataFrame(data)
         
-        # Get unique timestamps and groups
-        timestamps = set()
-        groups = set()
-        
-        for item in data:
-            timestamps.add(item.get('timestamp'))
-            groups.add(item.get('label'))
+        # Data points per timestamp (sorted by timestamp) and unique groups
+        points_per_timestamp = df.groupby('timestamp', sort=True).size()
+        timestamps = points_per_timestamp.index.tolist()
+        groups = sorted(df['label'].unique().tolist())
         
         print(f"   Unique Timestamps: {len(timestamps)}")
-        print(f"   Groups: {sorted(list(groups))}")
-        
-        # Calculate data points per timestamp
-        df = pd.DataFrame(data)
-        points_per_timestamp = df.groupby('timestamp').size()
+        print(f"   Groups: {groups}")
         print(f"   Data points per timestamp: {points_per_timestamp.to_dict()}")
         
         # Calculate batch information
         if ENABLE_SMART_BATCHING:
-            # For smart batching, we need to analyze timestamp distribution
-            timestamp_groups = {}
-            for item in data:
-                ts = item.get('timestamp')
-                if ts not in timestamp_groups:
-                    timestamp_groups[ts] = []
-                timestamp_groups[ts].append(item)
+            # Group rows by timestamp once; _create_smart_batches reuses the same index
+            self._get_timestamp_indices(df)
             
             # Estimate batches based on smart batching strategy
             current_batch_size = 0
             estimated_batches = 1
-            for ts, records in sorted(timestamp_groups.items()):
-                if current_batch_size + len(records) > BATCH_SIZE and current_batch_size > 0:
+            for records_count in points_per_timestamp.tolist():
+                if current_batch_size + records_count > BATCH_SIZE and current_batch_size > 0:
                     estimated_batches += 1
-                    current_batch_size = len(records)
+                    current_batch_size = records_count
                 else:
-                    current_batch_size += len(records)
+                    current_batch_size += records_count
             
             print(f"   Estimated Smart Batches: {estimated_batches}")
             print(f"   Max Batch Size: {BATCH_SIZE}")
@@ -128,8 +182,8 @@ class BatchProcessor:
         analysis = {
             "total_points": len(data),
             "unique_timestamps": len(timestamps),
-            "groups": sorted(list(groups)),
-            "timestamps": sorted(list(timestamps)),
+            "groups": groups,
+            "timestamps": timestamps,
             "points_per_timestamp": points_per_timestamp.to_dict(),
             "batch_config": {
                 "batch_size": self.batch_size,
@@ -141,8 +195,8 @@ class BatchProcessor:
         }
         
         analysis_file = OUTPUT_DIR / "data_analysis.json"
-        with open(analysis_file, 'w') as f:
-            json.dump(analysis, f, indent=2)
+        with open(analysis_file, 'wb') as f:
+            f.write(dumps_json(analysis, indent=True))
         print(f"📁 Data analysis saved to: {analysis_file}")
     
     def get_auth_token(self) -> bool:
@@ -179,14 +233,14 @@ class BatchProcessor:
                     "password": password
                 }
                 
-                response = requests.post(
+                response = self.get_session().post(
                     f"{BASE_URL}/auth/login",
                     json=login_data,
                     headers={"Content-Type": "application/json"}
                 )
                 
                 if response.status_code == 200:
-                    data = response.json()
+                    data = loads_json(response.content)
                     if data.get("success"):
                         self.auth_token = data.get("token")
                         print("✅ Login successful!")
@@ -253,17 +307,12 @@ class BatchProcessor:
         print(f"   Total data points: {total_points}")
         print(f"   Max batch size: {BATCH_SIZE}")
         
-        # Step 1: Group all records by timestamp
-        timestamp_groups = {}
-        for record in data:
-            timestamp = record.get('timestamp')
-            if timestamp not in timestamp_groups:
-                timestamp_groups[timestamp] = []
-            timestamp_groups[timestamp].append(record)
+        # Step 1: Group all records by timestamp (row positions from a single pandas groupby)
+        timestamp_indices = self._get_timestamp_indices()
         
         # Step 2: Count records per timestamp and sort timestamps
-        timestamp_counts = {ts: len(records) for ts, records in timestamp_groups.items()}
-        sorted_timestamps = sorted(timestamp_groups.keys())
+        sorted_timestamps = sorted(timestamp_indices)
+        timestamp_counts = {ts: len(timestamp_indices[ts]) for ts in sorted_timestamps}
         
         print(f"   Unique timestamps: {len(sorted_timestamps)}")
         print(f"   Records per timestamp: {timestamp_counts}")
@@ -274,7 +323,7 @@ class BatchProcessor:
         batch_num = 1
         
         for timestamp in sorted_timestamps:
-            records = timestamp_groups[timestamp]
+            records = [data[i] for i in timestamp_indices[timestamp].tolist()]
             records_count = len(records)
             
             # Check if adding this timestamp group would exceed batch size
@@ -310,16 +359,16 @@ class BatchProcessor:
         }
         
         analysis_file = OUTPUT_DIR / "smart_batching_analysis.json"
-        with open(analysis_file, 'w') as f:
-            json.dump(smart_analysis, f, indent=2)
+        with open(analysis_file, 'wb') as f:
+            f.write(dumps_json(smart_analysis, indent=True))
         print(f"📁 Smart batching analysis saved to: {analysis_file}")
     
     def process_batch(self, batch: List[Dict], batch_num: int) -> Dict[str, Any]:
         """Process a single batch of data."""
-        print(f"\n🔬 Processing Batch {batch_num}...")
+        self._print(f"\n🔬 Processing Batch {batch_num}...")
         
         if not self.auth_token:
-            print("⚠️  No authentication token - batch will likely fail")
+            self._print(f"⚠️  No authentication token - batch {batch_num} will likely fail")
         
         headers = {
             "Content-Type": "application/json"
@@ -335,41 +384,43 @@ class BatchProcessor:
             "alpha": 0.05
         }
         
-        start_time = time.time()
+        payload_body = dumps_json(batch_payload)  # encoded once, reused by the retry below
+        
+        start_time = time.perf_counter()
         
         # Add extra delay for the first batch to ensure server is ready
         if batch_num == 1:
-            print(f"   ⏳ Adding extra delay for first batch...")
+            self._print(f"   ⏳ Adding extra delay for first batch...")
             time.sleep(3)  # Extra 3 seconds for first batch
         
         try:
-            response = requests.post(
+            response = self.get_session().post(
                 f"{BASE_URL}/analyze/tukey",
-                json=batch_payload,
+                data=payload_body,
                 headers=headers,
                 timeout=120  # Increased timeout for first batch
             )
             
-            end_time = time.time()
+            end_time = time.perf_counter()
             duration = end_time - start_time
             
-            print(f"   Status Code: {response.status_code}")
-            print(f"   Response Time: {duration:.3f} seconds")
+            self._print(f"   Batch {batch_num} Status Code: {response.status_code}",
+                        f"   Batch {batch_num} Response Time: {duration:.3f} seconds")
             
             if response.status_code == 200:
-                result = response.json()
-                print(f"   ✅ Batch {batch_num} successful!")
-                print(f"      User: {result.get('user')}")
-                print(f"      Parameter: {result.get('parameter')}")
-                print(f"      Test Type: {result.get('test_type')}")
-                print(f"      Batch Size: {result.get('batch_size')}")
-                print(f"      Results Count: {len(result.get('results', []))}")
+                result = loads_json(response.content)
+                self._print(f"   ✅ Batch {batch_num} successful!",
+                            f"      User: {result.get('user')}",
+                            f"      Parameter: {result.get('parameter')}",
+                            f"      Test Type: {result.get('test_type')}",
+                            f"      Batch Size: {result.get('batch_size')}",
+                            f"      Results Count: {len(result.get('results', []))}")
                 
                 # Save individual batch result
                 batch_file = OUTPUT_DIR / f"batch_{batch_num}_results.json"
-                with open(batch_file, 'w') as f:
-                    json.dump(result, f, indent=2)
-                print(f"   📁 Batch results saved to: {batch_file}")
+                with open(batch_file, 'wb') as f:
+                    f.write(dumps_json(result, indent=True))
+                self._print(f"   📁 Batch {batch_num} results saved to: {batch_file}")
                 
                 return {
                     'batch_num': batch_num,
@@ -382,7 +433,7 @@ class BatchProcessor:
                 }
                 
             elif response.status_code == 401:
-                print(f"   ❌ Authentication failed for batch {batch_num}")
+                self._print(f"   ❌ Authentication failed for batch {batch_num}")
                 return {
                     'batch_num': batch_num,
                     'success': False,
@@ -391,8 +442,8 @@ class BatchProcessor:
                     'status_code': response.status_code
                 }
             elif response.status_code == 400:
-                error_data = response.json()
-                print(f"   ❌ Batch {batch_num} failed: {error_data.get('detail', 'Unknown error')}")
+                error_data = loads_json(response.content)
+                self._print(f"   ❌ Batch {batch_num} failed: {error_data.get('detail', 'Unknown error')}")
                 return {
                     'batch_num': batch_num,
                     'success': False,
@@ -401,7 +452,7 @@ class BatchProcessor:
                     'status_code': response.status_code
                 }
             else:
-                print(f"   ❌ Batch {batch_num} failed with status {response.status_code}")
+                self._print(f"   ❌ Batch {batch_num} failed with status {response.status_code}")
                 return {
                     'batch_num': batch_num,
                     'success': False,
@@ -411,27 +462,27 @@ class BatchProcessor:
                 }
                 
         except requests.exceptions.ConnectionError:
-            print(f"   ❌ Could not connect to server for batch {batch_num}")
+            self._print(f"   ❌ Could not connect to server for batch {batch_num}")
             
             # Retry logic for first batch or connection errors
             if batch_num == 1:
-                print(f"   🔄 Retrying batch {batch_num} after 5 seconds...")
+                self._print(f"   🔄 Retrying batch {batch_num} after 5 seconds...")
                 time.sleep(5)
                 try:
-                    response = requests.post(
+                    response = self.get_session().post(
                         f"{BASE_URL}/analyze/tukey",
-                        json=batch_payload,
+                        data=payload_body,
                         headers=headers,
                         timeout=120
                     )
                     
                     if response.status_code == 200:
-                        result = response.json()
-                        print(f"   ✅ Batch {batch_num} retry successful!")
+                        result = loads_json(response.content)
+                        self._print(f"   ✅ Batch {batch_num} retry successful!")
                         return {
                             'batch_num': batch_num,
                             'success': True,
-                            'duration': time.time() - start_time,
+                            'duration': time.perf_counter() - start_time,
                             'status_code': response.status_code,
                             'result_count': len(result.get('results', [])),
                             'data_points': len(batch),
@@ -439,7 +490,7 @@ class BatchProcessor:
                             'retried': True
                         }
                 except Exception as retry_e:
-                    print(f"   ❌ Batch {batch_num} retry also failed: {str(retry_e)}")
+                    self._print(f"   ❌ Batch {batch_num} retry also failed: {str(retry_e)}")
             
             return {
                 'batch_num': batch_num,
@@ -448,7 +499,7 @@ class BatchProcessor:
                 'duration': 0
             }
         except Exception as e:
-            print(f"   ❌ Batch {batch_num} error: {str(e)}")
+            self._print(f"   ❌ Batch {batch_num} error: {str(e)}")
             return {
                 'batch_num': batch_num,
                 'success': False,
@@ -472,7 +523,7 @@ class BatchProcessor:
         """Process batches sequentially."""
         print("\n📋 Processing batches sequentially...")
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         batch_num = 1
         successful_batches = 0
         total_batches = 0
@@ -490,7 +541,7 @@ class BatchProcessor:
             # Add small delay between batches to avoid overwhelming the server
             time.sleep(0.5)
         
-        self.total_processing_time = time.time() - start_time
+        self.total_processing_time = time.perf_counter() - start_time
         
         print(f"\n📊 Sequential Processing Complete!")
         print(f"   Total Batches: {total_batches}")
@@ -501,9 +552,60 @@ class BatchProcessor:
         return successful_batches > 0
     
     def _process_batches_parallel(self) -> bool:
-        """Process batches in parallel (placeholder for future implementation)."""
-        print("\n📋 Parallel processing not yet implemented, falling back to sequential...")
-        return self._process_batches_sequential()
+        """Process batches concurrently, at most MAX_CONCURRENT_BATCHES in flight."""
+        print(f"\n📋 Processing batches in parallel (max {MAX_CONCURRENT_BATCHES} at a time)...")
+        
+        # Keep at most 2 batches per worker in flight so pending payloads don't pile up in memory
+        max_in_flight = 2 * MAX_CONCURRENT_BATCHES
+        
+        start_time = time.perf_counter()
+        results_by_batch = {}
+        
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            future_to_batch = {}
+            
+            # Batches are built lazily; when the window is full, wait for any batch to finish
+            for batch_num, batch in enumerate(self.create_batches(), 1):
+                if len(future_to_batch) >= max_in_flight:
+                    done, _ = wait(future_to_batch, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_done = future_to_batch.pop(future)
+                        results_by_batch[batch_done] = self._batch_future_result(future, batch_done)
+                future_to_batch[executor.submit(self.process_batch, batch, batch_num)] = batch_num
+            
+            # Drain the remaining batches as they complete
+            for future in as_completed(future_to_batch):
+                batch_done = future_to_batch[future]
+                results_by_batch[batch_done] = self._batch_future_result(future, batch_done)
+        
+        # Report results in batch order, as the sequential path does
+        results = [results_by_batch[batch_num] for batch_num in sorted(results_by_batch)]
+        self.batch_results.extend(results)
+        self.total_processing_time = time.perf_counter() - start_time
+        
+        total_batches = len(results)
+        successful_batches = sum(1 for r in results if r['success'])
+        
+        print(f"\n📊 Parallel Processing Complete!")
+        print(f"   Total Batches: {total_batches}")
+        print(f"   Successful: {successful_batches}")
+        print(f"   Failed: {total_batches - successful_batches}")
+        print(f"   Total Time: {self.total_processing_time:.3f} seconds")
+        
+        return successful_batches > 0
+    
+    def _batch_future_result(self, future: Future, batch_num: int) -> Dict[str, Any]:
+        """Return a finished batch's result, turning an unexpected exception into a failed result."""
+        try:
+            return future.result()
+        except Exception as e:
+            self._print(f"   ❌ Batch {batch_num} generated an exception: {str(e)}")
+            return {
+                'batch_num': batch_num,
+                'success': False,
+                'error': str(e),
+                'duration': 0
+            }
     
     def merge_batch_results(self) -> Dict[str, Any]:
         """Merge all batch results into a single comprehensive result."""
@@ -544,8 +646,8 @@ class BatchProcessor:
         
         # Save merged results
         merged_file = OUTPUT_DIR / "merged_results.json"
-        with open(merged_file, 'w') as f:
-            json.dump(merged_result, f, indent=2)
+        with open(merged_file, 'wb') as f:
+            f.write(dumps_json(merged_result, indent=True))
         print(f"📁 Merged results saved to: {merged_file}")
         
         return merged_result
@@ -590,8 +692,8 @@ class BatchProcessor:
         
         # Save report
         report_file = OUTPUT_DIR / "batch_processing_report.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_file, 'wb') as f:
+            f.write(dumps_json(report, indent=True))
         
         print(f"📁 Batch processing report saved to: {report_file}")
         
@@ -631,7 +733,7 @@ def main():
     # Health check before starting batch processing
     print(f"\n🏥 Performing health check before batch processing...")
     try:
-        health_response = requests.get(f"{BASE_URL}/health", timeout=10)
+        health_response = processor.get_session().get(f"{BASE_URL}/health", timeout=10)
         if health_response.status_code == 200:
             print(f"✅ Server health check passed")
         else:
@@ -5,7 +5,9 @@ Divides data into configurable batches and processes them in parallel using 4 wo
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import gzip
 import os
 import time
 import pandas as pd
@@ -14,9 +16,17 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional, Generator
 import math
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
 from queue import Queue
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from collections import defaultdict
+import atexit
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
 
 # Configuration
 BASE_URL = "http://localhost:8000"
@@ -27,6 +37,7 @@ MAX_CONCURRENT_BATCHES = 4  # Maximum number of batches to process simultaneousl
 ENABLE_PARALLEL_PROCESSING = True  # Set to True to enable parallel processing
 ENABLE_SMART_BATCHING = True  # Use smart batching strategy (group by timestamp)
 NUM_WORKERS = 4  # Number of worker threads
+COMPRESS_REQUESTS = False  # gzip request bodies (server must use app.compression.GzipRoute)
 
 # Path to test data
 SCRIPT_DIR = Path(__file__).parent
@@ -38,15 +49,37 @@ OUTPUT_DIR = SCRIPT_DIR /"API_test_output" /"batch_processing_threaded_output" /
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # Set up logging without Unicode characters
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(OUTPUT_DIR / "threaded_processing.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+# Worker threads only enqueue records; a background listener does the file/console I/O
+log_queue = Queue(-1)
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler(OUTPUT_DIR / "threaded_processing.log", encoding='utf-8'),
+    logging.StreamHandler()
 )
-logger = logging.getLogger(__name__)
+# Dedicated logger instead of basicConfig, so the root logger (and any library
+# or importer that configures it) never gets our handlers attached twice
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'))
+logger = logging.getLogger("batch_processor_threaded")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.handlers.clear()
+logger.addHandler(queue_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush queued records before interpreter shutdown
+
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """Serialize an object to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+def loads_json(data: bytes) -> Any:
+    """Parse UTF-8 JSON bytes (e.g. response.content), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 class ThreadedBatchProcessor:
     """Process large datasets by dividing them into manageable batches using multiple threads."""
@@ -62,6 +95,20 @@ class ThreadedBatchProcessor:
         self.lock = threading.Lock()  # Thread lock for shared resources
         self.active_workers = 0
         self.max_active_workers = 0
+        self._timestamp_groups = None  # Cached timestamp -> records partition
+        self._payload_prefix = b""  # Pre-serialized constant part of every batch payload
+        
+        # One keep-alive Session per thread, so workers never contend on a shared pool lock
+        self._thread_local = threading.local()
+        
+    def get_session(self) -> requests.Session:
+        """Return the calling thread's Session, creating it on first use."""
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._thread_local.session = session
+        return session
         
     def load_test_data(self, data_path: Optional[Path] = None) -> bool:
         """Load and validate test data from JSON file."""
@@ -71,6 +118,10 @@ class ThreadedBatchProcessor:
         try:
             with open(data_path, 'r') as f:
                 self.test_data = json.load(f)
+            self._timestamp_groups = None
+            # Serialize the constant envelope once; "data" is last so batches can be spliced in
+            envelope = dumps_json({"parameter": self.test_data.get("parameter"), "alpha": 0.05, "data": []})
+            self._payload_prefix = envelope[:-2]  # strip the trailing "]}"
             
             logger.info("Test data loaded successfully")
             logger.info(f"   Parameter: {self.test_data.get('parameter')}")
@@ -121,12 +172,7 @@ class ThreadedBatchProcessor:
         # Calculate batch information
         if ENABLE_SMART_BATCHING:
             # For smart batching, we need to analyze timestamp distribution
-            timestamp_groups = {}
-            for item in data:
-                ts = item.get('timestamp')
-                if ts not in timestamp_groups:
-                    timestamp_groups[ts] = []
-                timestamp_groups[ts].append(item)
+            timestamp_groups = self._get_timestamp_groups()
             
             # Estimate batches based on smart batching strategy
             current_batch_size = 0
@@ -162,10 +208,19 @@ class ThreadedBatchProcessor:
         }
         
         analysis_file = OUTPUT_DIR / "data_analysis.json"
-        with open(analysis_file, 'w') as f:
-            json.dump(analysis, f, indent=2)
+        with open(analysis_file, 'wb') as f:
+            f.write(dumps_json(analysis, indent=True))
         logger.info(f"Data analysis saved to: {analysis_file}")
     
+    def _get_timestamp_groups(self) -> Dict[str, List[Dict]]:
+        """Group records by timestamp once and reuse the partition for analysis and batching."""
+        if self._timestamp_groups is None:
+            timestamp_groups = defaultdict(list)
+            for record in self.test_data.get('data', []):
+                timestamp_groups[record.get('timestamp')].append(record)
+            self._timestamp_groups = dict(timestamp_groups)
+        return self._timestamp_groups
+    
     def get_auth_token(self) -> bool:
         """Get authentication token either manually or via login."""
         print("\nAuthentication Options:")
@@ -200,7 +255,7 @@ class ThreadedBatchProcessor:
                     "password": password
                 }
                 
-                response = requests.post(
+                response = self.get_session().post(
                     f"{BASE_URL}/auth/login",
                     json=login_data,
                     headers={"Content-Type": "application/json"}
@@ -234,12 +289,12 @@ class ThreadedBatchProcessor:
             print("Invalid choice")
             return False
     
-    def create_batches(self) -> List[List[Dict]]:
-        """Create batches from the test data and return as a list."""
+    def create_batches(self) -> Generator[List[Dict], None, None]:
+        """Create batches from the test data lazily, one batch at a time."""
         if ENABLE_SMART_BATCHING:
-            return list(self._create_smart_batches())
+            return self._create_smart_batches()
         else:
-            return list(self._create_simple_batches())
+            return self._create_simple_batches()
     
     def _create_simple_batches(self) -> Generator[List[Dict], None, None]:
         """Create simple sequential batches."""
@@ -274,13 +329,8 @@ class ThreadedBatchProcessor:
         logger.info(f"   Total data points: {total_points}")
         logger.info(f"   Max batch size: {BATCH_SIZE}")
         
-        # Step 1: Group all records by timestamp
-        timestamp_groups = {}
-        for record in data:
-            timestamp = record.get('timestamp')
-            if timestamp not in timestamp_groups:
-                timestamp_groups[timestamp] = []
-            timestamp_groups[timestamp].append(record)
+        # Step 1: Group all records by timestamp (cached from the data analysis)
+        timestamp_groups = self._get_timestamp_groups()
         
         # Step 2: Count records per timestamp and sort timestamps
         timestamp_counts = {ts: len(records) for ts, records in timestamp_groups.items()}
@@ -304,8 +354,8 @@ class ThreadedBatchProcessor:
                 logger.info(f"   Batch {batch_num}: {len(current_batch)} data points ({current_batch_size} records)")
                 yield current_batch
                 
-                # Start new batch with current timestamp group
-                current_batch = records
+                # Start new batch with current timestamp group (copy so the cached group is not extended)
+                current_batch = list(records)
                 current_batch_size = records_count
                 batch_num += 1
             else:
@@ -331,14 +381,14 @@ class ThreadedBatchProcessor:
         }
         
         analysis_file = OUTPUT_DIR / "smart_batching_analysis.json"
-        with open(analysis_file, 'w') as f:
-            json.dump(smart_analysis, f, indent=2)
+        with open(analysis_file, 'wb') as f:
+            f.write(dumps_json(smart_analysis, indent=True))
         logger.info(f"Smart batching analysis saved to: {analysis_file}")
     
     def process_batch(self, batch: List[Dict], batch_num: int) -> Dict[str, Any]:
         """Process a single batch of data."""
         thread_name = threading.current_thread().name
-        logger.info(f"[{thread_name}] Processing Batch {batch_num}...")
+        logger.info("[%s] Processing Batch %d...", thread_name, batch_num)
         
         # Track active workers
         with self.lock:
@@ -347,7 +397,7 @@ class ThreadedBatchProcessor:
         
         try:
             if not self.auth_token:
-                logger.warning(f"[{thread_name}] No authentication token - batch will likely fail")
+                logger.warning("[%s] No authentication token - batch will likely fail", thread_name)
             
             headers = {
                 "Content-Type": "application/json"
@@ -356,48 +406,49 @@ class ThreadedBatchProcessor:
             if self.auth_token:
                 headers["Authorization"] = f"Bearer {self.auth_token}"
             
-            # Prepare payload for this batch
-            batch_payload = {
-                "parameter": self.test_data.get("parameter"),
-                "data": batch,
-                "alpha": 0.05
-            }
+            # Splice this batch into the pre-serialized envelope; the retry path reuses the bytes
+            payload_body = self._payload_prefix + dumps_json(batch)[1:] + b"}"
+            if COMPRESS_REQUESTS:
+                payload_body = gzip.compress(payload_body, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
             
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Add extra delay for the first batch to ensure server is ready
             if batch_num == 1:
-                logger.info(f"   [{thread_name}] Adding extra delay for first batch...")
+                logger.info("   [%s] Adding extra delay for first batch...", thread_name)
                 time.sleep(3)  # Extra 3 seconds for first batch
             
             try:
-                response = requests.post(
+                response = self.get_session().post(
                     f"{BASE_URL}/analyze/tukey",
-                    json=batch_payload,
+                    data=payload_body,
                     headers=headers,
                     timeout=120  # Increased timeout for first batch
                 )
                 
-                end_time = time.time()
+                end_time = time.perf_counter()
                 duration = end_time - start_time
                 
-                logger.info(f"   [{thread_name}] Status Code: {response.status_code}")
-                logger.info(f"   [{thread_name}] Response Time: {duration:.3f} seconds")
+                # Per-batch details are DEBUG only so workers don't serialize on log I/O
+                logger.debug("   [%s] Status Code: %d", thread_name, response.status_code)
+                logger.debug("   [%s] Response Time: %.3f seconds", thread_name, duration)
                 
                 if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"   [{thread_name}] Batch {batch_num} successful!")
-                    logger.info(f"      [{thread_name}] User: {result.get('user')}")
-                    logger.info(f"      [{thread_name}] Parameter: {result.get('parameter')}")
-                    logger.info(f"      [{thread_name}] Test Type: {result.get('test_type')}")
-                    logger.info(f"      [{thread_name}] Batch Size: {result.get('batch_size')}")
-                    logger.info(f"      [{thread_name}] Results Count: {len(result.get('results', []))}")
+                    result = loads_json(response.content)
+                    logger.info("   [%s] Batch %d successful! (%.3fs)", thread_name, batch_num, duration)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("      [%s] User: %s", thread_name, result.get('user'))
+                        logger.debug("      [%s] Parameter: %s", thread_name, result.get('parameter'))
+                        logger.debug("      [%s] Test Type: %s", thread_name, result.get('test_type'))
+                        logger.debug("      [%s] Batch Size: %s", thread_name, result.get('batch_size'))
+                        logger.debug("      [%s] Results Count: %d", thread_name, len(result.get('results', [])))
                     
                     # Save individual batch result
                     batch_file = OUTPUT_DIR / f"batch_{batch_num}_results.json"
-                    with open(batch_file, 'w') as f:
-                        json.dump(result, f, indent=2)
-                    logger.info(f"   [{thread_name}] Batch results saved to: {batch_file}")
+                    with open(batch_file, 'wb') as f:
+                        f.write(dumps_json(result, indent=True))
+                    logger.debug("   [%s] Batch results saved to: %s", thread_name, batch_file)
                     
                     return {
                         'batch_num': batch_num,
@@ -411,7 +462,7 @@ class ThreadedBatchProcessor:
                     }
                     
                 elif response.status_code == 401:
-                    logger.error(f"   [{thread_name}] Authentication failed for batch {batch_num}")
+                    logger.error("   [%s] Authentication failed for batch %d", thread_name, batch_num)
                     return {
                         'batch_num': batch_num,
                         'success': False,
@@ -422,7 +473,7 @@ class ThreadedBatchProcessor:
                     }
                 elif response.status_code == 400:
                     error_data = response.json()
-                    logger.error(f"   [{thread_name}] Batch {batch_num} failed: {error_data.get('detail', 'Unknown error')}")
+                    logger.error("   [%s] Batch %d failed: %s", thread_name, batch_num, error_data.get('detail', 'Unknown error'))
                     return {
                         'batch_num': batch_num,
                         'success': False,
@@ -432,7 +483,7 @@ class ThreadedBatchProcessor:
                         'thread_name': thread_name
                     }
                 else:
-                    logger.error(f"   [{thread_name}] Batch {batch_num} failed with status {response.status_code}")
+                    logger.error("   [%s] Batch %d failed with status %d", thread_name, batch_num, response.status_code)
                     return {
                         'batch_num': batch_num,
                         'success': False,
@@ -443,27 +494,27 @@ class ThreadedBatchProcessor:
                     }
                     
             except requests.exceptions.ConnectionError:
-                logger.error(f"   [{thread_name}] Could not connect to server for batch {batch_num}")
+                logger.error("   [%s] Could not connect to server for batch %d", thread_name, batch_num)
                 
                 # Retry logic for first batch or connection errors
                 if batch_num == 1:
-                    logger.info(f"   [{thread_name}] Retrying batch {batch_num} after 5 seconds...")
+                    logger.info("   [%s] Retrying batch %d after 5 seconds...", thread_name, batch_num)
                     time.sleep(5)
                     try:
-                        response = requests.post(
+                        response = self.get_session().post(
                             f"{BASE_URL}/analyze/tukey",
-                            json=batch_payload,
+                            data=payload_body,
                             headers=headers,
                             timeout=120
                         )
                         
                         if response.status_code == 200:
-                            result = response.json()
-                            logger.info(f"   [{thread_name}] Batch {batch_num} retry successful!")
+                            result = loads_json(response.content)
+                            logger.info("   [%s] Batch %d retry successful!", thread_name, batch_num)
                             return {
                                 'batch_num': batch_num,
                                 'success': True,
-                                'duration': time.time() - start_time,
+                                'duration': time.perf_counter() - start_time,
                                 'status_code': response.status_code,
                                 'result_count': len(result.get('results', [])),
                                 'data_points': len(batch),
@@ -472,7 +523,7 @@ class ThreadedBatchProcessor:
                                 'thread_name': thread_name
                             }
                     except Exception as retry_e:
-                        logger.error(f"   [{thread_name}] Batch {batch_num} retry also failed: {str(retry_e)}")
+                        logger.error("   [%s] Batch %d retry also failed: %s", thread_name, batch_num, retry_e)
                 
                 return {
                     'batch_num': batch_num,
@@ -482,7 +533,7 @@ class ThreadedBatchProcessor:
                     'thread_name': thread_name
                 }
             except Exception as e:
-                logger.error(f"   [{thread_name}] Batch {batch_num} error: {str(e)}")
+                logger.error("   [%s] Batch %d error: %s", thread_name, batch_num, e)
                 return {
                     'batch_num': batch_num,
                     'success': False,
@@ -511,50 +562,35 @@ class ThreadedBatchProcessor:
         """Process batches in parallel using ThreadPoolExecutor."""
         logger.info("Processing batches in parallel with ThreadPoolExecutor...")
         
-        # Create all batches first
-        batches = self.create_batches()
-        total_batches = len(batches)
-        
-        logger.info(f"   Total batches to process: {total_batches}")
         logger.info(f"   Number of worker threads: {self.num_workers}")
         
-        start_time = time.time()
+        # Keep at most 2 batches per worker in flight so pending payloads don't pile up in memory
+        max_in_flight = 2 * self.num_workers
+        logger.info(f"   Max batches in flight: {max_in_flight}")
+        
+        start_time = time.perf_counter()
         successful_batches = 0
-        failed_batches = 0
+        total_batches = 0
         
         # Use ThreadPoolExecutor to process batches in parallel
         with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            # Submit all batch processing tasks
-            future_to_batch = {
-                executor.submit(self.process_batch, batch, i + 1): i + 1 
-                for i, batch in enumerate(batches)
-            }
+            future_to_batch = {}
+            
+            # Batches are built lazily; when the window is full, wait for any batch to finish
+            for batch_num, batch in enumerate(self.create_batches(), 1):
+                if len(future_to_batch) >= max_in_flight:
+                    done, _ = wait(future_to_batch, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        successful_batches += self._collect_batch_result(future, future_to_batch.pop(future))
+                future_to_batch[executor.submit(self.process_batch, batch, batch_num)] = batch_num
+                total_batches = batch_num
             
-            # Collect results as they complete
+            # Drain the remaining batches as they complete
             for future in as_completed(future_to_batch):
-                batch_num = future_to_batch[future]
-                try:
-                    result = future.result()
-                    self.batch_results.append(result)
-                    
-                    if result['success']:
-                        successful_batches += 1
-                        logger.info(f"Batch {batch_num} completed successfully")
-                    else:
-                        failed_batches += 1
-                        logger.error(f"Batch {batch_num} failed: {result.get('error', 'Unknown error')}")
-                        
-                except Exception as e:
-                    failed_batches += 1
-                    logger.error(f"Batch {batch_num} generated an exception: {str(e)}")
-                    self.batch_results.append({
-                        'batch_num': batch_num,
-                        'success': False,
-                        'error': str(e),
-                        'thread_name': 'Unknown'
-                    })
+                successful_batches += self._collect_batch_result(future, future_to_batch[future])
         
-        self.total_processing_time = time.time() - start_time
+        failed_batches = total_batches - successful_batches
+        self.total_processing_time = time.perf_counter() - start_time
         
         logger.info("Parallel Processing Complete!")
         logger.info(f"   Total Batches: {total_batches}")
@@ -565,11 +601,32 @@ class ThreadedBatchProcessor:
         
         return successful_batches > 0
     
+    def _collect_batch_result(self, future: Future, batch_num: int) -> bool:
+        """Record the result of a finished batch future and return whether it succeeded."""
+        try:
+            result = future.result()
+            self.batch_results.append(result)
+            
+            if result['success']:
+                logger.debug("Batch %d completed successfully", batch_num)
+                return True
+            logger.error("Batch %d failed: %s", batch_num, result.get('error', 'Unknown error'))
+            
+        except Exception as e:
+            logger.error("Batch %d generated an exception: %s", batch_num, e)
+            self.batch_results.append({
+                'batch_num': batch_num,
+                'success': False,
+                'error': str(e),
+                'thread_name': 'Unknown'
+            })
+        return False
+    
     def _process_batches_sequential(self) -> bool:
         """Process batches sequentially (fallback)."""
         logger.info("Processing batches sequentially...")
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         batch_num = 1
         successful_batches = 0
         total_batches = 0
@@ -587,7 +644,7 @@ class ThreadedBatchProcessor:
             # Add small delay between batches to avoid overwhelming the server
             time.sleep(0.5)
         
-        self.total_processing_time = time.time() - start_time
+        self.total_processing_time = time.perf_counter() - start_time
         
         logger.info("Sequential Processing Complete!")
         logger.info(f"   Total Batches: {total_batches}")
@@ -638,8 +695,8 @@ class ThreadedBatchProcessor:
         
         # Save merged results
         merged_file = OUTPUT_DIR / "merged_results.json"
-        with open(merged_file, 'w') as f:
-            json.dump(merged_result, f, indent=2)
+        with open(merged_file, 'wb') as f:
+            f.write(dumps_json(merged_result, indent=True))
         logger.info(f"Merged results saved to: {merged_file}")
         
         return merged_result
@@ -700,8 +757,8 @@ class ThreadedBatchProcessor:
         
         # Save report
         report_file = OUTPUT_DIR / "threaded_batch_processing_report.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        with open(report_file, 'wb') as f:
+            f.write(dumps_json(report, indent=True))
         
         logger.info(f"Threaded batch processing report saved to: {report_file}")
         
@@ -752,7 +809,7 @@ def main():
     # Health check before starting batch processing
     logger.info("Performing health check before threaded batch processing...")
     try:
-        health_response = requests.get(f"{BASE_URL}/health", timeout=10)
+        health_response = processor.get_session().get(f"{BASE_URL}/health", timeout=10)
         if health_response.status_code == 200:
             logger.info("Server health check passed")
         else:
@@ -0,0 +1,68 @@
+import zlib
+from typing import Callable
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from app.config import BatchValidationConfig
+
+class GzipRequest(Request):
+    """Request that transparently decompresses gzip-encoded bodies."""
+
+    async def body(self) -> bytes:
+        """
+        Read the request body, decompressing it when sent with Content-Encoding: gzip.
+
+        The body is decompressed incrementally while it streams in, and decoding stops as
+        soon as the output exceeds BatchValidationConfig.MAX_DECOMPRESSED_BODY_BYTES, so a
+        small compressed upload cannot expand into an unbounded allocation.
+
+        Returns:
+            Raw (decompressed) request body
+
+        Raises:
+            HTTPException: 400 if the body is not valid gzip data,
+                413 if it decompresses to more than the allowed size
+        """
+        if not hasattr(self, "_body"):
+            if "gzip" in self.headers.getlist("Content-Encoding"):
+                self._body = await self._read_gzip_body(BatchValidationConfig.MAX_DECOMPRESSED_BODY_BYTES)
+            else:
+                self._body = await super().body()
+        return self._body
+
+    async def _read_gzip_body(self, max_size: int) -> bytes:
+        """Stream-decompress a (possibly multi-member) gzip body, capped at max_size bytes."""
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        parts = []
+        total = 0
+        try:
+            async for chunk in self.stream():
+                while chunk:
+                    # Never ask for more than one byte past the cap
+                    output = decompressor.decompress(chunk, max_size + 1 - total)
+                    total += len(output)
+                    if total > max_size:
+                        raise HTTPException(status_code=413, detail="Decompressed request body too large")
+                    parts.append(output)
+                    if decompressor.eof and decompressor.unused_data:
+                        # Concatenated gzip members (as accepted by gzip.decompress)
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    else:
+                        chunk = b""
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid gzip request body")
+        if not decompressor.eof:
+            raise HTTPException(status_code=400, detail="Invalid gzip request body")
+        return b"".join(parts)
+
+class GzipRoute(APIRoute):
+    """API route that accepts gzip-compressed request bodies (large analysis batches)."""
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def gzip_route_handler(request: Request) -> Response:
+            request = GzipRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return gzip_route_handler
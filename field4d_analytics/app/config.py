@@ -7,6 +7,11 @@ class BatchValidationConfig:
     # Simple batch size limit
     MAX_BATCH_SIZE = 15000  # Maximum allowed batch size
     
+    # Upper bound on a gzip-decoded request body: MAX_BATCH_SIZE points at a generous
+    # per-point allowance (a typical point serializes to well under 100 bytes)
+    MAX_POINT_BYTES = 1024
+    MAX_DECOMPRESSED_BODY_BYTES = MAX_BATCH_SIZE * MAX_POINT_BYTES  # ~15 MB
+    
     # Recommended batch sizes based on dataset size
     RECOMMENDED_BATCH_SIZES = {
         50000: 10000,    # ≤ 50K points → recommend 10K batch
@@ -80,6 +85,7 @@ Please split your data into batches of maximum {recommended_batch_size:,} points
         """Convert config to dictionary for logging/debugging."""
         return {
             'max_batch_size': cls.MAX_BATCH_SIZE,
+            'max_decompressed_body_bytes': cls.MAX_DECOMPRESSED_BODY_BYTES,
             'recommended_batch_sizes': cls.RECOMMENDED_BATCH_SIZES,
             'description': 'Simple batch size validation with 15K limit and recommendations'
         }
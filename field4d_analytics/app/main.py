@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import APIRouter, FastAPI, HTTPException, Depends
 from app.test_models import (
     TestRequest, TukeyTestRequest
 )
@@ -7,6 +7,7 @@ from app.config import BatchValidationConfig, AppConfig
 from app.auth.models import LoginRequest, LoginResponse, User
 from app.auth.cloud_auth_service import cloud_auth
 from app.auth.middleware import get_current_user
+from app.compression import GzipRoute
 import pandas as pd
 import logging
 import json
@@ -20,6 +21,9 @@ app = FastAPI(
     version=AppConfig.API_VERSION
 )
 
+# Analysis routes accept Content-Encoding: gzip request bodies (size-capped, see app.compression)
+analysis_router = APIRouter(route_class=GzipRoute)
+
 @app.get("/health")
 def health():
     """Basic health check endpoint."""
@@ -97,7 +101,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Individual test endpoints
-@app.post("/analyze/tukey")
+@analysis_router.post("/analyze/tukey")
 async def analyze_tukey(payload: TukeyTestRequest, current_user: User = Depends(get_current_user)):
     """ANOVA with Tukey's test endpoint."""
     data = [d.dict() for d in payload.data]
@@ -130,7 +134,7 @@ async def analyze_tukey(payload: TukeyTestRequest, current_user: User = Depends(
 
 
 # Legacy endpoint for backward compatibility
-@app.post("/analyze")
+@analysis_router.post("/analyze")
 async def analyze(payload: TestRequest, current_user: User = Depends(get_current_user)):
     """
     Legacy endpoint for backward compatibility.
@@ -173,4 +177,6 @@ async def analyze(payload: TestRequest, current_user: User = Depends(get_current
         }
     except Exception as e:
         logger.error(f"Statistical test failed: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Statistical test failed: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Statistical test failed: {str(e)}") 
+
+app.include_router(analysis_router)